@@ -2,11 +2,11 @@
 """
 analysis_report.py
 
-월단위 트레이딩 리포트(CSV)를 불러와 자동으로 통계를 내고 결과를 CSV로 저장합니다.
+월단위 트레이딩 리포트(CSV/Parquet)를 불러와 자동으로 통계를 내고 결과를 CSV로 저장합니다.
 
 주요 기능:
  1. 날짜별 청산 확률 계산 및 CSV 저장
- 2. 시간대별 청산 확률 계산(내림차순) 및 CSV 저장
+ 2. 시간대별 청산 확률 계산(내림차순) 및 CSV 저장 (1·2 는 한 번의 groupby 로 함께 계산)
  3. 여러 룩백(5m,10m,30m,1h,6h) 가격 변동 기준 TP/LIQ 승률 계산 및 CSV 저장
  4. 모든 필터(날짜, 시간대, 룩백) 적용 시 최대 TP 승률 계산 및 CSV 저장
 
@@ -18,60 +18,90 @@ Usage:
     --month YYYY-MM
 """
 import argparse
+import numpy as np
 import pandas as pd
 
+from utils.fileio import read_csv, read_table
+
 # ── 유틸 함수 ─────────────────────────────────────────────
 
 def loadReports(liqPath: str, tpPath: str) -> pd.DataFrame:
-    """LIQ/TP 리포트 CSV를 로드하고 통합, KST 컬럼 추가"""
-    liq = pd.read_csv(liqPath, parse_dates=['Entry_Time'])
-    tp  = pd.read_csv(tpPath, parse_dates=['Entry_Time'])
+    """LIQ/TP 리포트(CSV 또는 Parquet)를 로드하고 통합, KST 컬럼 추가"""
+    liq = read_table(liqPath, parse_dates=['Entry_Time'])
+    tp  = read_table(tpPath, parse_dates=['Entry_Time'])
     liq['Result'] = 'LIQ'
     tp['Result']  = 'TP'
     df = pd.concat([liq, tp], ignore_index=True)
+    df['Result'] = pd.Categorical(df['Result'], categories=['TP', 'LIQ', 'OPEN'])
     df['Entry_Time'] = pd.to_datetime(df['Entry_Time']).dt.tz_convert('Asia/Seoul')
-    df['Date'] = df['Entry_Time'].dt.date
-    df['Hour'] = df['Entry_Time'].dt.hour
+    # 월·일·시 키는 정수로 한 번만 계산 (필터/그룹 키로 재사용)
+    t = df['Entry_Time'].dt
+    df['YM']   = (t.year * 100 + t.month).astype('int32')
+    df['YMD']  = (df['YM'] * 100 + t.day).astype('int32')
+    df['Hour'] = t.hour.astype('int8')
     return df
 
 
-def computeDateStats(df: pd.DataFrame, month: str) -> pd.DataFrame:
-    mask = df['Entry_Time'].dt.strftime('%Y-%m') == month
-    sub = df[mask]
-    dateCounts = sub.groupby('Date').size().rename('Total')
-    liqCounts  = sub[sub['Result']=='LIQ'].groupby('Date').size().rename('LIQ')
-    stats = pd.concat([dateCounts, liqCounts], axis=1).fillna(0)
-    stats['LIQ_Prob(%)'] = (stats['LIQ'] / stats['Total'] * 100).round(2)
-    stats = stats.sort_index().reset_index()
-    return stats[['Date','Total','LIQ','LIQ_Prob(%)']]
-
+def monthKey(month: str) -> int:
+    """'YYYY-MM' → YYYYMM (loadReports 의 YM 열과 비교)"""
+    return int(month.replace('-', ''))
 
-def computeHourStats(df: pd.DataFrame, month: str) -> pd.DataFrame:
-    mask = df['Entry_Time'].dt.strftime('%Y-%m') == month
-    sub = df[mask]
-    hourCounts = sub.groupby('Hour').size().rename('Total')
-    liqCounts  = sub[sub['Result']=='LIQ'].groupby('Hour').size().rename('LIQ')
-    stats = pd.concat([hourCounts, liqCounts], axis=1).fillna(0)
-    stats['LIQ_Prob(%)'] = (stats['LIQ'] / stats['Total'] * 100).round(2)
-    stats = stats.sort_values('LIQ_Prob(%)', ascending=False).reset_index()
-    return stats[['Hour','Total','LIQ','LIQ_Prob(%)']]
 
-
-def computeLookbackStats(df: pd.DataFrame, pricePath: str, month: str) -> pd.DataFrame:
-    priceDf = pd.read_csv(pricePath, parse_dates=['date'])
+def loadPrices(pricePath: str) -> pd.DataFrame:
+    """변환 가격 CSV → 시간순 정렬된 time 인덱스 · price 열"""
+    priceDf = read_csv(pricePath, usecols=['date', 'close'], parse_dates=['date'])
     priceDf.rename(columns={'date':'time','close':'price'}, inplace=True)
-    priceDf.set_index('time', inplace=True)
-    mask = df['Entry_Time'].dt.strftime('%Y-%m') == month
+    return priceDf.set_index('time').sort_index()
+
+
+def computeAllStats(df: pd.DataFrame, month: str) -> tuple:
+    """날짜별 · 시간대별 청산 확률을 한 번의 groupby 로 계산 → (dateStats, hourStats)"""
+    sub = df[df['YM'] == monthKey(month)]
+    grouped = (sub.groupby(['YMD', 'Hour', 'Result'], observed=True).size()
+                  .unstack('Result', fill_value=0))
+    cells = pd.DataFrame({
+        'Total': grouped.sum(axis=1),
+        'LIQ':   grouped['LIQ'] if 'LIQ' in grouped.columns else 0,
+    })
+
+    dateStats = cells.groupby(level='YMD').sum()
+    dateStats['LIQ_Prob(%)'] = (dateStats['LIQ'] / dateStats['Total'] * 100).round(2)
+    dateStats = dateStats.sort_index().reset_index()
+    dateStats['Date'] = pd.to_datetime(dateStats['YMD'].astype(str), format='%Y%m%d').dt.date
+
+    hourStats = cells.groupby(level='Hour').sum()
+    hourStats['LIQ_Prob(%)'] = (hourStats['LIQ'] / hourStats['Total'] * 100).round(2)
+    hourStats = hourStats.sort_values('LIQ_Prob(%)', ascending=False).reset_index()
+    return dateStats[['Date','Total','LIQ','LIQ_Prob(%)']], hourStats[['Hour','Total','LIQ','LIQ_Prob(%)']]
+
+
+def pastPrices(priceDf: pd.DataFrame, entryTimes: pd.Series, lookbacks: list) -> np.ndarray:
+    """각 진입 시각 기준 lb분 전(직전 봉) 가격을 (N, len(lookbacks)) 행렬로 반환 (priceDf 는 시간순 정렬)
+
+    (진입, 룩백) 쌍을 long 형식으로 펼쳐 UTC ns 정수 키로 merge_asof 한 번에 조인.
+    """
+    price = priceDf['price']
+    right = pd.DataFrame({'key': price.index.as_unit('ns').asi8, 'price': price.to_numpy()})
+    entryNs = pd.DatetimeIndex(entryTimes).as_unit('ns').asi8
+    shiftNs = np.asarray(lookbacks, dtype=np.int64) * 60_000_000_000
+    keys = (entryNs[:, None] - shiftNs[None, :]).ravel()
+    order = np.argsort(keys, kind='stable')
+    merged = pd.merge_asof(pd.DataFrame({'key': keys[order]}), right, on='key', direction='backward')
+    past = np.empty(len(keys))
+    past[order] = merged['price'].to_numpy()
+    return past.reshape(len(entryNs), len(lookbacks))
+
+
+def computeLookbackStats(df: pd.DataFrame, priceDf: pd.DataFrame, month: str) -> pd.DataFrame:
+    mask = df['YM'] == monthKey(month)
     sub = df[mask].copy()
     lookbacks = [5,10,30,60,360]
+    past = pastPrices(priceDf, sub['Entry_Time'], lookbacks)
+    rets = ((sub['Entry_Price'].to_numpy()[:, None] - past) / past) * 100
     records = []
-    for lb in lookbacks:
+    for k, lb in enumerate(lookbacks):
         col = f'Ret_{lb}m'
-        sub[col] = sub.apply(
-            lambda r: ((r['Entry_Price'] - priceDf['price'].asof(r['Entry_Time'] - pd.Timedelta(minutes=lb)))
-                       / priceDf['price'].asof(r['Entry_Time'] - pd.Timedelta(minutes=lb))) * 100,
-            axis=1
-        )
+        sub[col] = rets[:, k]
         bins = [-float('inf'), -1, -0.5, 0, 0.5, float('inf')]
         labels = ['<-1%','-1~-0.5','-0.5~0','0~0.5','>0.5%']
         bin_col = f'Bin_{lb}m'
@@ -86,21 +116,15 @@ def computeLookbackStats(df: pd.DataFrame, pricePath: str, month: str) -> pd.Dat
     return pd.concat(records, ignore_index=True)
 
 
-def computeOptimizedTP(df: pd.DataFrame, pricePath: str, month: str) -> pd.DataFrame:
-    mask = df['Entry_Time'].dt.strftime('%Y-%m') == month
+def computeOptimizedTP(df: pd.DataFrame, priceDf: pd.DataFrame, month: str) -> pd.DataFrame:
+    mask = df['YM'] == monthKey(month)
     sub = df[mask].copy()
-    topDates = sub[sub['Result']=='LIQ']['Date'].value_counts().head(3).index
-    sub = sub[~sub['Date'].isin(topDates)]
+    topDates = sub[sub['Result']=='LIQ']['YMD'].value_counts().head(3).index
+    sub = sub[~sub['YMD'].isin(topDates)]
     topHours = sub[sub['Result']=='LIQ']['Hour'].value_counts().head(2).index
     sub = sub[~sub['Hour'].isin(topHours)]
-    priceDf = pd.read_csv(pricePath, parse_dates=['date'])
-    priceDf.rename(columns={'date':'time','close':'price'}, inplace=True)
-    priceDf.set_index('time', inplace=True)
-    sub['Ret_30m'] = sub.apply(
-        lambda r: ((r['Entry_Price'] - priceDf['price'].asof(r['Entry_Time'] - pd.Timedelta(minutes=30)))
-                   / priceDf['price'].asof(r['Entry_Time'] - pd.Timedelta(minutes=30))) * 100,
-        axis=1
-    )
+    past = pastPrices(priceDf, sub['Entry_Time'], [30])[:, 0]
+    sub['Ret_30m'] = ((sub['Entry_Price'].to_numpy() - past) / past) * 100
     sub = sub[sub['Ret_30m'] < 0]
     tpCount = (sub['Result']=='TP').sum()
     totalCount = len(sub)
@@ -116,10 +140,10 @@ def main():
     args = parser.parse_args()
 
     df = loadReports(args.liq, args.tp)
-    dateStats = computeDateStats(df, args.month)
-    hourStats = computeHourStats(df, args.month)
-    lookStats = computeLookbackStats(df, args.price, args.month)
-    optStats  = computeOptimizedTP(df, args.price, args.month)
+    dateStats, hourStats = computeAllStats(df, args.month)
+    priceDf = loadPrices(args.price)
+    lookStats = computeLookbackStats(df, priceDf, args.month)
+    optStats  = computeOptimizedTP(df, priceDf, args.month)
 
     dateStats.to_csv(f'date_stats_{args.month}.csv', index=False)
     hourStats.to_csv(f'hour_stats_{args.month}.csv', index=False)
@@ -3,11 +3,11 @@
 
 * 변환기(convert_csv_timestamp)로 만든 `<이름>_converted.csv` 사용
 * 지정 월(YYYY-MM) 전체 1 분 진입 → TP · LIQ · OPEN 판정
-* 결과 CSV 4종 자동 저장
-  1) <out>.csv      : TP + LIQ (OPEN 제외)
-  2) <out>_liq.csv  : LIQ 전용
-  3) <out>_tp.csv   : TP 전용
-  4) <out>_open.csv : OPEN 전용
+* 결과 4종 자동 저장 (기본 Parquet, --csv 지정 시 CSV)
+  1) <out>.parquet      : TP + LIQ (OPEN 제외)
+  2) <out>_liq.parquet  : LIQ 전용
+  3) <out>_tp.parquet   : TP 전용
+  4) <out>_open.parquet : OPEN 전용
 * 콘솔에 TP / LIQ / OPEN 비율 통계 출력
 """
 
@@ -16,108 +16,168 @@ import argparse
 import os
 import numpy as np
 
+from utils._njit import njit, prange
+from utils.fileio import read_csv
+from utils.crossing import sparse_table, first_ge, first_le
+from utils.parallel import run_starts
+from utils.period import month_bounds
+from utils.report import save_results
+
 # ───────────────── 전략 파라미터 ─────────────────
 LEVERAGE = 20
 ROI_NET  = 0.05
 FEE_MAKER = 0.0002
 INIT_M    = 2000
 ADD_M     = 800
-DROPS     = [0.01, 0.02, 0.03, 0.04]
+DROPS     = (0.01, 0.02, 0.03, 0.04)
 MMR       = 0.005
+KEEP_MMR  = 1 - MMR   # LIQ 식 분모 상수
+
+# 결과 코드 (simulate 반환값)
+RES_TP, RES_LIQ, RES_OPEN = 0, 1, 2
+RESULTS = ('TP', 'LIQ', 'OPEN')
 # ────────────────────────────────────────────────
 
 # ① 변환 CSV 로드 → time·price 두 열
 def load_converted(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+    df = read_csv(path)
     if 'date' not in df.columns or 'close' not in df.columns:
         raise ValueError("CSV 에 'date' 또는 'close' 컬럼이 없습니다.")
     df['time'] = pd.to_datetime(df['date'])  # UTC
     df['price'] = pd.to_numeric(df['close'], errors='coerce')
     return df[['time', 'price']].dropna().reset_index(drop=True)
 
-# ② 물타기 계획
-def make_plan(entry: float):
+# ② 물타기 계획 (전체 진입가 일괄 계산)
+def build_plans(entries: np.ndarray) -> dict:
+    """진입가 배열 → step 0~4 별 trigger · tp · avg · qty · margin · liq, 각 (N, 5) 행렬"""
     r_gross = ROI_NET
     t = r_gross / LEVERAGE
+    N = len(entries)
+    steps = len(DROPS) + 1
+    plans = {k: np.empty((N, steps)) for k in ('trigger', 'tp', 'avg', 'qty', 'margin', 'liq')}
     m = INIT_M
     n = INIT_M * LEVERAGE
-    q = n / entry
-    avg = entry
-    plan = []
-    plan.append(dict(step=0, trigger=entry, avg=avg, tp=avg * (1 + t), margin=m, qty=q))
-    for d in DROPS:
+    q = n / entries
+    avg = entries
+    plans['trigger'][:, 0] = entries
+    plans['tp'][:, 0]      = avg * (1 + t)
+    plans['avg'][:, 0]     = avg
+    plans['qty'][:, 0]     = q
+    plans['margin'][:, 0]  = m
+    plans['liq'][:, 0]     = (avg * q - m) / (q * KEEP_MMR)
+    for k, d in enumerate(DROPS, start=1):
         trigger_price = avg * (1 - d)
         m += ADD_M
         n += ADD_M * LEVERAGE
-        q += (ADD_M * LEVERAGE) / trigger_price
+        q = q + (ADD_M * LEVERAGE) / trigger_price
         avg = n / q
-        plan.append(dict(step=len(plan), trigger=trigger_price, avg=avg, tp=avg * (1 + t), margin=m, qty=q))
-    return plan  # step: 0~4
+        plans['trigger'][:, k] = trigger_price
+        plans['tp'][:, k]      = avg * (1 + t)
+        plans['avg'][:, k]     = avg
+        plans['qty'][:, k]     = q
+        plans['margin'][:, k]  = m
+        plans['liq'][:, k]     = (avg * q - m) / (q * KEEP_MMR)
+    return plans
 
 # ③ 한 포지션 시뮬레이션
-def simulate(df: pd.DataFrame, start: int) -> dict:
-    entry = df.at[start, 'price']
-    plan = make_plan(entry)
+@njit(cache=True)
+def simulate(prices, start, plan_triggers, plan_tps, plan_liqs, tbl_min, tbl_max, water_out):
+    """반환: (결과코드, 보유분, 청산 인덱스(-1=OPEN), 물타기 횟수)
+
+    물타기 체결 봉 인덱스는 water_out[step] 에 직접 기록 (-1 로 초기화된 행을 받는다).
+
+    봉 단위 스캔 대신 TP / 다음 물타기 / LIQ 중 가장 먼저 닿는 봉을 sparse table 로 찾는다.
+    같은 봉에서는 기존과 동일하게 TP → 물타기 → LIQ 순으로 판정.
+    """
+    last = len(plan_triggers) - 1
     pos = 0
-    tp_price = plan[0]['tp']
-    waters = []
-    for i in range(start + 1, len(df)):
-        price = df.at[i, 'price']
-        timestamp = df.at[i, 'time']
+    s = start + 1
+    tp_price = plan_tps[0]
+    liq_price = plan_liqs[0]
+    while True:
+        j_tp  = first_ge(tbl_max, prices, s, tp_price)
+        j_liq = first_le(tbl_min, prices, s, liq_price)
+        j_w   = first_le(tbl_min, prices, s, plan_triggers[pos + 1]) if pos < last else -1
         # TP 달성
-        if price >= tp_price:
-            return dict(res='TP', hold=i - start, exit=timestamp, waters=waters)
-        # 물타기 단계 진입
-        while pos < len(plan) - 1 and price <= plan[pos + 1]['trigger']:
-            pos += 1
-            waters.append(timestamp)
-            tp_price = plan[pos]['tp']
-        # LIQ 달성 조건 계산
-        avg = plan[pos]['avg']
-        qty = plan[pos]['qty']
-        margin = plan[pos]['margin']
-        liq_price = (avg * qty - margin) / (qty * (1 - MMR))
-        if price <= liq_price:
-            return dict(res='LIQ', hold=i - start, exit=timestamp, waters=waters)
-    # 월말까지 OPEN
-    return dict(res='OPEN', hold=len(df) - start - 1, exit=None, waters=waters)
+        if j_tp >= 0 and (j_liq < 0 or j_tp <= j_liq) and (j_w < 0 or j_tp <= j_w):
+            return RES_TP, j_tp - start, j_tp, pos
+        # 물타기 단계 진입 (LIQ 와 같은 봉이면 물타기 먼저)
+        if j_w >= 0 and (j_liq < 0 or j_w <= j_liq):
+            price = prices[j_w]
+            while pos < last and price <= plan_triggers[pos + 1]:
+                water_out[pos] = j_w
+                pos += 1
+            # 단계가 바뀔 때만 TP/LIQ 가격 갱신
+            tp_price = plan_tps[pos]
+            liq_price = plan_liqs[pos]
+            if price <= liq_price:
+                return RES_LIQ, j_w - start, j_w, pos
+            s = j_w + 1
+            continue
+        # LIQ 달성
+        if j_liq >= 0:
+            return RES_LIQ, j_liq - start, j_liq, pos
+        # 월말까지 OPEN
+        return RES_OPEN, len(prices) - start - 1, -1, pos
+
+# 진입 시점 병렬 시뮬레이션 (진입마다 독립 → prange, 결과는 i 번째 슬롯에 기록)
+@njit(cache=True, parallel=True, nogil=True)
+def simulate_all(prices, starts, plan_triggers, plan_tps, plan_avgs, plan_qtys, plan_liqs, tbl_min, tbl_max):
+    N = len(starts)
+    res_code = np.empty(N, np.int8)
+    hold     = np.empty(N, np.int64)
+    exit_idx = np.empty(N, np.int64)
+    water_cnt = np.empty(N, np.int64)
+    waters   = np.full((N, len(DROPS)), -1, np.int64)
+    profit   = np.zeros(N)
+    for i in prange(N):
+        start = starts[i]
+        code, h, e, wc = simulate(prices, start, plan_triggers[start], plan_tps[start], plan_liqs[start],
+                                  tbl_min, tbl_max, waters[i])
+        res_code[i] = code
+        hold[i] = h
+        exit_idx[i] = e
+        water_cnt[i] = wc
+        if code == RES_TP:
+            profit[i] = plan_qtys[start, wc] * (plan_tps[start, wc] - plan_avgs[start, wc])
+    return res_code, hold, exit_idx, water_cnt, waters, profit
+
+# 인덱스 배열 → 타임스탬프 (-1 은 NaT)
+def take_times(times: pd.Series, idx: np.ndarray):
+    return times.array.take(idx, allow_fill=True)
 
 # ④ 월간 백테스트
-def backtest(df: pd.DataFrame, month: str, out_base: str):
-    mdf = df[df['time'].dt.strftime('%Y-%m') == month].reset_index(drop=True)
-    records = []
-    for idx in range(len(mdf)):
-        sim = simulate(mdf, idx)
-        entry_price = mdf.at[idx, 'price']
-        water_cnt = len(sim['waters'])
-        plan = make_plan(entry_price)
-        if sim['res'] == 'TP':
-            profit = plan[water_cnt]['qty'] * (plan[water_cnt]['tp'] - plan[water_cnt]['avg'])
-        else:
-            profit = 0
-        record = dict(
-            Entry_Time=mdf.at[idx, 'time'],
-            Entry_Price=entry_price,
-            Result=sim['res'],
-            Hold_Min=sim['hold'],
-            Exit_Time=sim['exit'],
-            WaterCnt=water_cnt,
-            Profit=round(profit, 2)
-        )
-        # 물타기별 타임스탬프
-        for j in range(len(DROPS)):
-            record[f'Water{j+1}'] = sim['waters'][j] if j < len(sim['waters']) else None
-        records.append(record)
-        if idx % 3000 == 0:
-            print(f'... {idx}/{len(mdf)} done')
+def backtest(df: pd.DataFrame, month: str, out_base: str, csv: bool = False):
+    lo, hi = month_bounds(month, df['time'].dt.tz)
+    mdf = df[(df['time'] >= lo) & (df['time'] < hi)].reset_index(drop=True)
+    prices = mdf['price'].to_numpy(np.float64)
+    print(f'... {len(mdf)} entries simulating')
+    tbl_min = sparse_table(prices, False)
+    tbl_max = sparse_table(prices, True)
+    plans = build_plans(prices)
+    res_code, hold, exit_idx, water_cnt, waters, profit = run_starts(
+        simulate_all, prices,
+        plans['trigger'], plans['tp'], plans['avg'], plans['qty'], plans['liq'],
+        tbl_min, tbl_max,
+    )
 
-    df_res = pd.DataFrame(records)
+    # 청산 · 물타기 인덱스 → 타임스탬프 한 번에 변환 (열 우선으로 펼쳐 열마다 연속 구간)
+    N = len(mdf)
+    times = take_times(mdf['time'], np.concatenate([exit_idx, waters.T.ravel()]))
+    df_res = pd.DataFrame({
+        'Entry_Time':  mdf['time'],
+        'Entry_Price': prices,
+        'Result':      pd.Categorical.from_codes(res_code, RESULTS),
+        'Hold_Min':    hold,
+        'Exit_Time':   times[:N],
+        'WaterCnt':    water_cnt,
+        'Profit':      profit.round(2),
+        # 물타기별 타임스탬프
+        **{f'Water{j+1}': times[(j + 1) * N:(j + 2) * N] for j in range(len(DROPS))},
+    })
 
     # 파일 저장: TP+LIQ, LIQ, TP, OPEN
-    df_res[df_res['Result'] != 'OPEN']           .to_csv(f"{out_base}.csv",    index=False)
-    df_res[df_res['Result'] == 'LIQ']            .to_csv(f"{out_base}_liq.csv", index=False)
-    df_res[df_res['Result'] == 'TP']             .to_csv(f"{out_base}_tp.csv",  index=False)
-    df_res[df_res['Result'] == 'OPEN']           .to_csv(f"{out_base}_open.csv",index=False)
+    save_results(df_res, out_base, csv)
 
     # 통계 출력
     total = len(df_res)
@@ -153,7 +213,8 @@ if __name__ == '__main__':
     parser.add_argument('converted_csv')
     parser.add_argument('--month', default='2025-03')
     parser.add_argument('--out',   default='march_sim_report')
+    parser.add_argument('--csv',   action='store_true', help='Parquet 대신 CSV 로 저장')
     args = parser.parse_args()
 
     price_df = load_converted(args.converted_csv)
-    backtest(price_df, args.month, os.path.splitext(args.out)[0])
+    backtest(price_df, args.month, os.path.splitext(args.out)[0], args.csv)
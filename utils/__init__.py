@@ -0,0 +1 @@
+"""시뮬레이터 스크립트 공용 유틸"""
@@ -0,0 +1,24 @@
+"""numba 선택 의존성 래퍼
+
+numba 가 설치돼 있으면 `njit` / `prange` 를 그대로 내보내고,
+없으면 데코레이터는 원본 함수를 돌려주고 `prange` 는 `range` 로 대체한다.
+(순수 파이썬으로도 같은 결과가 나오도록 커널은 numpy 배열만 사용)
+"""
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:  # numba 미설치 → 순수 파이썬 실행
+    HAS_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        # @njit 과 @njit(cache=True, ...) 두 형태 모두 지원
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def deco(fn):
+            return fn
+        return deco
+
+__all__ = ['njit', 'prange', 'HAS_NUMBA']
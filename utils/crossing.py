@@ -0,0 +1,74 @@
+"""가격 배열 first-crossing 조회
+
+구간 최소/최대 sparse table 을 한 번 만들어 두고
+"start 이후 처음으로 price >= x (또는 <= x) 가 되는 인덱스" 를 O(log N) 에 찾는다.
+진입마다 월말까지 선형 스캔하던 TP/LIQ/물타기 판정을 대체.
+
+테이블은 float32 로 저장해 메모리 대역폭을 절반으로 줄인다.
+최대 테이블은 올림, 최소 테이블은 내림으로 반올림해 "이 구간은 건너뛰어도 된다" 판정이
+항상 안전하고, 멈춘 봉은 float64 원본 가격으로 다시 확인하므로 결과는 float64 비교와 동일.
+"""
+
+import numpy as np
+
+from utils._njit import njit
+
+
+@njit(cache=True)
+def sparse_table(prices, use_max):
+    """tbl[k, i] = prices[i : i + 2**k] 의 최대(use_max, 올림) 또는 최소(내림), float32"""
+    N = len(prices)
+    K = 1
+    while (1 << K) <= N:
+        K += 1
+    tbl = np.empty((K, N), np.float32)
+    # 0층: float32 변환 후 원본보다 작으면(최대) 올림, 크면(최소) 내림
+    v = prices.astype(np.float32)
+    if use_max:
+        off = v < prices
+        v[off] = np.nextafter(v[off], np.float32(np.inf))
+    else:
+        off = v > prices
+        v[off] = np.nextafter(v[off], np.float32(-np.inf))
+    tbl[0] = v
+    # k층 = (k-1)층 두 구간의 원소별 최대/최소 → 층마다 배열 연산 한 번
+    for k in range(1, K):
+        half = 1 << (k - 1)
+        m = N - (1 << k) + 1
+        if use_max:
+            tbl[k, :m] = np.maximum(tbl[k - 1, :m], tbl[k - 1, half:half + m])
+        else:
+            tbl[k, :m] = np.minimum(tbl[k - 1, :m], tbl[k - 1, half:half + m])
+    return tbl
+
+
+@njit(cache=True)
+def first_ge(tbl_max, prices, start, x):
+    """start 이상에서 처음 prices[j] >= x 인 인덱스 (없으면 -1)"""
+    N = tbl_max.shape[1]
+    pos = start
+    while True:
+        for k in range(tbl_max.shape[0] - 1, -1, -1):
+            if pos + (1 << k) <= N and tbl_max[k, pos] < x:
+                pos += 1 << k
+        if pos >= N:
+            return -1
+        if prices[pos] >= x:
+            return pos
+        pos += 1  # 반올림 여유로 멈춘 봉 → 다음 봉부터 재탐색
+
+
+@njit(cache=True)
+def first_le(tbl_min, prices, start, x):
+    """start 이상에서 처음 prices[j] <= x 인 인덱스 (없으면 -1)"""
+    N = tbl_min.shape[1]
+    pos = start
+    while True:
+        for k in range(tbl_min.shape[0] - 1, -1, -1):
+            if pos + (1 << k) <= N and tbl_min[k, pos] > x:
+                pos += 1 << k
+        if pos >= N:
+            return -1
+        if prices[pos] <= x:
+            return pos
+        pos += 1  # 반올림 여유로 멈춘 봉 → 다음 봉부터 재탐색
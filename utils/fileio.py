@@ -0,0 +1,41 @@
+"""CSV / Parquet 입출력
+
+pyarrow 가 설치돼 있으면 멀티스레드 Arrow 파서(engine='pyarrow')로 읽고,
+없으면 pandas 기본 C 파서로 읽는다.
+"""
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_ARROW = True
+    CSV_ENGINE = 'pyarrow'
+except ImportError:  # pyarrow 미설치 → 단일 스레드 C 파서, Parquet 불가
+    HAS_ARROW = False
+    CSV_ENGINE = 'c'
+
+
+# Arrow 의 시각 자동 추론을 끄기 위한, 실제 값과 맞을 수 없는 형식
+_NO_TIMESTAMP = '%Y-%m-%d %H:%M:%S!'
+
+
+def read_csv(path: str, **kwargs) -> pd.DataFrame:
+    """C 파서와 같은 결과로 CSV 로드
+
+    Arrow 는 '2025-03-01 09:00:00+09:00' 같은 열을 UTC timestamp 로 바꿔 원래 오프셋(KST 등)을 잃는다.
+    → 시각 추론 없이 문자열로 읽고, parse_dates 열은 pandas 로 변환 (오프셋 유지)
+    """
+    if CSV_ENGINE != 'pyarrow':
+        return pd.read_csv(path, engine=CSV_ENGINE, **kwargs)
+    parse_dates = kwargs.pop('parse_dates', None) or ()
+    df = pd.read_csv(path, engine=CSV_ENGINE, date_format=_NO_TIMESTAMP, **kwargs)
+    for col in parse_dates:
+        df[col] = pd.to_datetime(df[col], format='ISO8601')
+    return df
+
+
+def read_table(path: str, columns: list = None, **kwargs) -> pd.DataFrame:
+    """확장자에 따라 Parquet 또는 CSV 로드 (columns 는 둘 다, kwargs 는 CSV 에만 적용)"""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    return read_csv(path, usecols=columns, **kwargs)
@@ -0,0 +1,27 @@
+"""진입 시점별 독립 시뮬레이션 병렬 실행
+
+numba 가 있으면 커널 내부 prange 로 스레드 병렬,
+없으면 진입 인덱스를 구간으로 나눠 ProcessPoolExecutor 로 분산한다.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from utils._njit import HAS_NUMBA
+
+
+def run_starts(kernel, prices: np.ndarray, *args) -> tuple:
+    """kernel(prices, starts, *args) → 배열 튜플 을 전체 진입 인덱스에 대해 실행"""
+    starts = np.arange(len(prices), dtype=np.int64)
+    ncpu = os.cpu_count() or 1
+    if HAS_NUMBA or ncpu == 1 or len(starts) == 0:
+        return kernel(prices, starts, *args)
+    # 월말 근처 진입은 금방 끝나므로 코어당 4구간으로 잘게 나눠 부하 균형
+    chunks = np.array_split(starts, ncpu * 4)
+    extra = [repeat(a) for a in args]
+    with ProcessPoolExecutor(max_workers=ncpu) as ex:
+        parts = list(ex.map(kernel, repeat(prices), chunks, *extra))
+    return tuple(np.concatenate(col) for col in zip(*parts))
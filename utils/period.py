@@ -0,0 +1,13 @@
+"""월(YYYY-MM) 구간 계산
+
+`.dt.strftime('%Y-%m') == month` 처럼 행마다 문자열을 만들지 않고
+[월초, 다음 달 월초) 타임스탬프 구간 비교로 월 필터링.
+"""
+
+import pandas as pd
+
+
+def month_bounds(month: str, tz=None) -> tuple:
+    """month 의 [시작, 끝) Timestamp 쌍 (tz 는 비교 대상 시계열의 tz 와 맞춘다)"""
+    start = pd.Timestamp(month, tz=tz)
+    return start, start + pd.offsets.MonthBegin(1)
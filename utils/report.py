@@ -0,0 +1,68 @@
+"""백테스트 결과 저장
+
+Result 열로 한 번만 분할해 4종 파일로 저장한다. (기본 Parquet, --csv 시 CSV)
+  <out>.parquet      : TP + LIQ (OPEN 제외)
+  <out>_liq.parquet  : LIQ 전용
+  <out>_tp.parquet   : TP 전용
+  <out>_open.parquet : OPEN 전용
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.fileio import HAS_ARROW
+
+
+def split_results(df_res: pd.DataFrame) -> dict:
+    """파일 접미사 → 행 위치 배열 (원래 순서 유지)"""
+    groups = df_res.groupby('Result', sort=False, observed=True).indices
+    empty = np.empty(0, np.int64)
+    tp, liq, opn = (groups.get(k, empty) for k in ('TP', 'LIQ', 'OPEN'))
+    return {
+        '':      np.sort(np.concatenate([tp, liq])),
+        '_liq':  liq,
+        '_tp':   tp,
+        '_open': opn,
+    }
+
+
+def _write_csv(df_res: pd.DataFrame, idx: np.ndarray, path: str, batch_size: int):
+    with open(path, 'w', newline='') as f:
+        # 빈 분할도 헤더는 기록
+        for k in range(0, max(len(idx), 1), batch_size):
+            df_res.iloc[idx[k:k + batch_size]].to_csv(f, header=(k == 0), index=False)
+
+
+def _write_parquet(df_res: pd.DataFrame, idx: np.ndarray, path: str, batch_size: int, schema):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    # 배치마다 Arrow 로 변환해 row group 하나씩 기록 (빈 분할은 스키마만)
+    with pq.ParquetWriter(path, schema, compression='zstd') as w:
+        for k in range(0, len(idx), batch_size):
+            part = df_res.iloc[idx[k:k + batch_size]]
+            w.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+
+
+def save_results(df_res: pd.DataFrame, out_base: str, csv: bool = False, batch_size: int = 16384):
+    """분할별로 batch_size 행씩 끊어 변환 · 기록 (CSV 텍스트, Parquet 는 배치당 row group 하나)
+    → 분할이나 전체 프레임의 Arrow/텍스트 복사본을 한꺼번에 만들지 않음
+
+    4개 파일은 스레드 풀에서 동시에 기록 (Arrow 인코딩 · 파일 I/O 는 GIL 을 놓는다)
+    """
+    if not csv and not HAS_ARROW:
+        print('pyarrow 미설치 → CSV 로 저장합니다.')
+        csv = True
+    parts = split_results(df_res)
+    if csv:
+        writer, ext, extra = _write_csv, 'csv', ()
+    else:
+        import pyarrow as pa
+        # 스키마는 한 번만 정해 모든 배치 · 파일에 공통 적용
+        writer, ext, extra = _write_parquet, 'parquet', (pa.Schema.from_pandas(df_res, preserve_index=False),)
+    with ThreadPoolExecutor(max_workers=len(parts)) as ex:
+        futs = [ex.submit(writer, df_res, idx, f"{out_base}{suffix}.{ext}", batch_size, *extra)
+                for suffix, idx in parts.items()]
+        for fut in futs:
+            fut.result()
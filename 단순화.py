@@ -3,27 +3,39 @@
 
 * 지정 월(YYYY-MM) 전체 1분 진입 → TP · LIQ · OPEN 판정
 * 물타기 없이 첫 진입만 사용
-* 결과 CSV 4종 자동 저장
-  1) <out>.csv      : TP + LIQ (OPEN 제외)
-  2) <out>_liq.csv  : LIQ 전용
-  3) <out>_tp.csv   : TP 전용
-  4) <out>_open.csv : OPEN 전용
+* 결과 4종 자동 저장 (기본 Parquet, --csv 지정 시 CSV)
+  1) <out>.parquet      : TP + LIQ (OPEN 제외)
+  2) <out>_liq.parquet  : LIQ 전용
+  3) <out>_tp.parquet   : TP 전용
+  4) <out>_open.parquet : OPEN 전용
 * 콘솔에 TP / LIQ / OPEN 비율 통계 출력
 """
 
 import pandas as pd
 import argparse
 import os
+import numpy as np
+
+from utils._njit import njit, prange
+from utils.fileio import read_csv
+from utils.parallel import run_starts
+from utils.period import month_bounds
+from utils.report import save_results
 
 # ───────────────── 전략 파라미터 ─────────────────
 LEVERAGE = 20
 ROI_NET  = 0.05    # 순수익률 목표 5%
 MMR       = 0.005  # 유지증거금 비율
+KEEP_MMR  = 1 - MMR  # LIQ 식 분모 상수
 INIT_M    = 2000   # 초기 증거금
+
+# 결과 코드 (simulate_no_scale 반환값)
+RES_TP, RES_LIQ, RES_OPEN = 0, 1, 2
+RESULTS = ('TP', 'LIQ', 'OPEN')
 # ────────────────────────────────────────────────
 
 def load_converted(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+    df = read_csv(path)
     if 'date' not in df.columns or 'close' not in df.columns:
         raise ValueError("CSV에 'date' 또는 'close' 컬럼이 없습니다.")
     df['time'] = pd.to_datetime(df['date'])
@@ -31,51 +43,56 @@ def load_converted(path: str) -> pd.DataFrame:
     return df[['time', 'price']].dropna().reset_index(drop=True)
 
 
-def simulate_no_scale(df: pd.DataFrame, start: int) -> dict:
-    entry = df.at[start, 'price']
+@njit(cache=True)
+def simulate_no_scale(prices, start):
+    """반환: (결과코드, 보유분, 청산 인덱스(-1=OPEN))"""
+    entry = prices[start]
     t = ROI_NET / LEVERAGE
     tp_price = entry * (1 + t)
     margin = INIT_M
     qty = (INIT_M * LEVERAGE) / entry
     avg = entry
+    # 물타기가 없으므로 LIQ 가격은 진입 시 한 번만 계산
+    liq_price = (avg * qty - margin) / (qty * KEEP_MMR)
 
-    for i in range(start + 1, len(df)):
-        price = df.at[i, 'price']
-        timestamp = df.at[i, 'time']
+    for i in range(start + 1, len(prices)):
+        price = prices[i]
         # TP 달성
         if price >= tp_price:
-            return dict(res='TP', hold=i - start, exit=timestamp)
-        # LIQ 달성 조건 계산
-        liq_price = (avg * qty - margin) / (qty * (1 - MMR))
+            return RES_TP, i - start, i
+        # LIQ 달성
         if price <= liq_price:
-            return dict(res='LIQ', hold=i - start, exit=timestamp)
+            return RES_LIQ, i - start, i
     # 월말까지 OPEN
-    return dict(res='OPEN', hold=len(df) - start - 1, exit=None)
-
-
-def backtest_no_scale(df: pd.DataFrame, month: str, out_base: str):
-    mdf = df[df['time'].dt.strftime('%Y-%m') == month].reset_index(drop=True)
-    records = []
-
-    for idx in range(len(mdf)):
-        sim = simulate_no_scale(mdf, idx)
-        record = dict(
-            Entry_Time=mdf.at[idx, 'time'],
-            Entry_Price=mdf.at[idx, 'price'],
-            Result=sim['res'],
-            Hold_Min=sim['hold'],
-            Exit_Time=sim['exit']
-        )
-        records.append(record)
-        if idx % 3000 == 0:
-            print(f'... {idx}/{len(mdf)} done')
-
-    df_res = pd.DataFrame(records)
+    return RES_OPEN, len(prices) - start - 1, -1
+
+
+@njit(cache=True, parallel=True, nogil=True)
+def simulate_all(prices, starts):
+    N = len(starts)
+    res_code = np.empty(N, np.int8)
+    hold     = np.empty(N, np.int64)
+    exit_idx = np.empty(N, np.int64)
+    for i in prange(N):
+        res_code[i], hold[i], exit_idx[i] = simulate_no_scale(prices, starts[i])
+    return res_code, hold, exit_idx
+
+
+def backtest_no_scale(df: pd.DataFrame, month: str, out_base: str, csv: bool = False):
+    lo, hi = month_bounds(month, df['time'].dt.tz)
+    mdf = df[(df['time'] >= lo) & (df['time'] < hi)].reset_index(drop=True)
+    prices = mdf['price'].to_numpy(np.float64)
+    res_code, hold, exit_idx = run_starts(simulate_all, prices)
+
+    df_res = pd.DataFrame({
+        'Entry_Time':  mdf['time'],
+        'Entry_Price': prices,
+        'Result':      pd.Categorical.from_codes(res_code, RESULTS),
+        'Hold_Min':    hold,
+        'Exit_Time':   pd.Series(mdf['time'].array.take(exit_idx, allow_fill=True)),
+    })
     # 파일 저장
-    df_res[df_res['Result'] != 'OPEN'].to_csv(f"{out_base}.csv",    index=False)
-    df_res[df_res['Result'] == 'LIQ'].to_csv(f"{out_base}_liq.csv", index=False)
-    df_res[df_res['Result'] == 'TP'].to_csv(f"{out_base}_tp.csv",  index=False)
-    df_res[df_res['Result'] == 'OPEN'].to_csv(f"{out_base}_open.csv",index=False)
+    save_results(df_res, out_base, csv)
 
     total = len(df_res)
     tp_rate   = df_res['Result'].eq('TP').mean()  * 100
@@ -90,7 +107,8 @@ if __name__ == '__main__':
     parser.add_argument('converted_csv')
     parser.add_argument('--month', default='2025-03')
     parser.add_argument('--out',   default='march_no_scale_report')
+    parser.add_argument('--csv',   action='store_true', help='Parquet 대신 CSV 로 저장')
     args = parser.parse_args()
 
     price_df = load_converted(args.converted_csv)
-    backtest_no_scale(price_df, args.month, os.path.splitext(args.out)[0])
+    backtest_no_scale(price_df, args.month, os.path.splitext(args.out)[0], args.csv)
@@ -4,20 +4,31 @@
 * 지정 월(YYYY-MM) 전체 1분봉 데이터로 멀티타임프레임 하락율 기반 진입 후 TP/LIQ/OPEN 판정
 * 물타기 없이 단일 진입(no-scale)
 * 하락율 임계치(thresholds)는 5, 10, 30, 60, 360분 기준으로 설정
-* 결과 CSV 4종 자동 저장:
-  1) <out>.csv      : TP+LIQ (OPEN 제외)
-  2) <out>_liq.csv  : LIQ 전용
-  3) <out>_tp.csv   : TP 전용
-  4) <out>_open.csv : OPEN 전용
+* 결과 4종 자동 저장 (기본 Parquet, --csv 지정 시 CSV):
+  1) <out>.parquet      : TP+LIQ (OPEN 제외)
+  2) <out>_liq.parquet  : LIQ 전용
+  3) <out>_tp.parquet   : TP 전용
+  4) <out>_open.parquet : OPEN 전용
 * 콘솔에 TP/LIQ/OPEN 비율 출력
 """
 import os
 import argparse
+import numpy as np
 import pandas as pd
 
+from utils._njit import njit
+from utils.crossing import sparse_table, first_ge, first_le
+from utils.fileio import read_csv
+from utils.period import month_bounds
+from utils.report import save_results
+
+# 결과 코드 (resolve_exits 반환값)
+RES_TP, RES_LIQ, RES_OPEN = 0, 1, 2
+RESULTS = ('TP', 'LIQ', 'OPEN')
+
 # ─────────────────────────────────────────
 def load_converted(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+    df = read_csv(path)
     if 'date' not in df.columns or 'close' not in df.columns:
         raise ValueError("CSV에 'date' 또는 'close' 컬럼이 없습니다.")
     df['time'] = pd.to_datetime(df['date'])
@@ -31,58 +42,70 @@ def compute_signals(df: pd.DataFrame, thresholds: dict) -> pd.Series:
     각 타임프레임 하락율이 threshold 이상일 때 Long 진입 신호(True)
     thresholds 예시: {5:0.01, 10:0.015, 30:0.02, 60:0.025, 360:0.03}
     """
-    signals = pd.Series(False, index=df.index)
-    for tf, th in thresholds.items():
-        past = df['price'].shift(tf)
-        drop = (past - df['price']) / past
-        signals |= (drop >= th)
-    return signals
+    prices = df['price'].to_numpy()
+    tfs = list(thresholds.keys())
+    ths = np.asarray(list(thresholds.values()), dtype=np.float64)
+    # (N, 타임프레임 수) 과거 가격 행렬, 앞부분은 NaN → 신호 없음
+    past = np.full((len(prices), len(tfs)), np.nan)
+    for k, tf in enumerate(tfs):
+        past[tf:, k] = prices[:-tf]
+    drops = (past - prices[:, None]) / past
+    return pd.Series((drops >= ths).any(axis=1), index=df.index)
 
 
-def simulate_no_scale(df: pd.DataFrame, signals: pd.Series, roi_net: float, leverage: int, init_m: float, mmr: float) -> pd.DataFrame:
-    records = []
-    df_list = df.reset_index()
-    idxs = [i for i, sig in enumerate(signals) if sig]
-    for start in idxs:
-        entry_price = df_list.at[start, 'price']
+@njit(cache=True)
+def resolve_exits(prices, idxs, roi_net, leverage, init_m, mmr, tbl_min, tbl_max):
+    """진입마다 TP / LIQ 첫 도달 봉을 sparse table 로 조회 → (결과코드, 보유분, 청산 인덱스)"""
+    N = len(prices)
+    res_code = np.full(len(idxs), RES_OPEN, np.int8)
+    hold     = np.empty(len(idxs), np.int64)
+    exit_idx = np.full(len(idxs), -1, np.int64)
+    for k in range(len(idxs)):
+        start = idxs[k]
+        entry_price = prices[start]
         t = roi_net / leverage
         tp_price = entry_price * (1 + t)
         margin = init_m
         qty = (init_m * leverage) / entry_price
         avg = entry_price
-        res, hold, exit_time = 'OPEN', None, None
-        for i in range(start + 1, len(df_list)):
-            price = df_list.at[i, 'price']
-            timestamp = df_list.at[i, 'time']
-            if price >= tp_price:
-                res, hold, exit_time = 'TP', i - start, timestamp
-                break
-            liq_price = (avg * qty - margin) / (qty * (1 - mmr))
-            if price <= liq_price:
-                res, hold, exit_time = 'LIQ', i - start, timestamp
-                break
-        if res == 'OPEN':
-            hold = len(df_list) - start - 1
-        records.append({
-            'Entry_Time': df_list.at[start, 'time'],
-            'Entry_Price': entry_price,
-            'Result': res,
-            'Hold_Min': hold,
-            'Exit_Time': exit_time
-        })
-    return pd.DataFrame(records)
+        liq_price = (avg * qty - margin) / (qty * (1 - mmr))
+        j_tp  = first_ge(tbl_max, prices, start + 1, tp_price)
+        j_liq = first_le(tbl_min, prices, start + 1, liq_price)
+        if j_tp >= 0 and (j_liq < 0 or j_tp <= j_liq):
+            res_code[k], hold[k], exit_idx[k] = RES_TP, j_tp - start, j_tp
+        elif j_liq >= 0:
+            res_code[k], hold[k], exit_idx[k] = RES_LIQ, j_liq - start, j_liq
+        else:
+            hold[k] = N - start - 1
+    return res_code, hold, exit_idx
+
+
+def simulate_no_scale(df: pd.DataFrame, signals: pd.Series, roi_net: float, leverage: int, init_m: float, mmr: float) -> pd.DataFrame:
+    prices = df['price'].to_numpy(dtype=np.float64)
+    times = df.index
+    idxs = np.flatnonzero(signals.to_numpy())
+    res_code, hold, exit_idx = resolve_exits(
+        prices, idxs, roi_net, leverage, init_m, mmr,
+        sparse_table(prices, False), sparse_table(prices, True),
+    )
+    return pd.DataFrame({
+        'Entry_Time':  times.array.take(idxs),
+        'Entry_Price': prices[idxs],
+        'Result':      pd.Categorical.from_codes(res_code, RESULTS),
+        'Hold_Min':    hold,
+        'Exit_Time':   times.array.take(exit_idx, allow_fill=True),
+    })
 
 
-def backtest(df_csv: str, month: str, out_base: str, thresholds: dict, roi_net: float, leverage: int, init_m: float, mmr: float):
+def backtest(df_csv: str, month: str, out_base: str, thresholds: dict, roi_net: float, leverage: int, init_m: float, mmr: float,
+             csv: bool = False):
     df = load_converted(df_csv)
-    df_month = df[df.index.strftime('%Y-%m') == month]
+    lo, hi = month_bounds(month, df.index.tz)
+    df_month = df[(df.index >= lo) & (df.index < hi)]
     signals = compute_signals(df_month, thresholds)
     df_res = simulate_no_scale(df_month, signals, roi_net, leverage, init_m, mmr)
     # CSV 저장
-    df_res[df_res['Result'] != 'OPEN'].to_csv(f"{out_base}.csv", index=False)
-    df_res[df_res['Result'] == 'LIQ'].to_csv(f"{out_base}_liq.csv", index=False)
-    df_res[df_res['Result'] == 'TP'].to_csv(f"{out_base}_tp.csv", index=False)
-    df_res[df_res['Result'] == 'OPEN'].to_csv(f"{out_base}_open.csv", index=False)
+    save_results(df_res, out_base, csv)
     # 통계 출력
     total = len(df_res)
     tp_rate = df_res['Result'].eq('TP').mean() * 100
@@ -105,10 +128,11 @@ if __name__ == '__main__':
     parser.add_argument('--roi_net',  type=float, default=0.05, help='순수익 목표')
     parser.add_argument('--init_m',   type=float, default=2000, help='초기 증거금')
     parser.add_argument('--mmr',      type=float, default=0.005, help='유지증거금 비율')
+    parser.add_argument('--csv',      action='store_true', help='Parquet 대신 CSV 로 저장')
     args = parser.parse_args()
 
     thr = {5: args.th5, 10: args.th10, 30: args.th30, 60: args.th60, 360: args.th360}
     backtest(
         args.converted_csv, args.month, os.path.splitext(args.out)[0],
-        thr, args.roi_net, args.leverage, args.init_m, args.mmr
+        thr, args.roi_net, args.leverage, args.init_m, args.mmr, args.csv
     )
@@ -1,7 +1,10 @@
+import numpy as np
 import pandas as pd
 import os
 from typing import Optional
 
+from utils.fileio import read_csv
+
 COLUMNS = [
     "timestamp",
     "open",
@@ -34,7 +37,7 @@ def convert_csv_timestamp(
     overwrite: bool = True
 ):
     # CSV 읽기
-    df = pd.read_csv(csv_path, header=None)
+    df = read_csv(csv_path, header=None)
 
     # 의미 있는 컬럼명 지정
     if len(df.columns) < len(COLUMNS):
@@ -45,7 +48,9 @@ def convert_csv_timestamp(
     # 타임스탬프 처리
     sample_ts = df[COLUMNS[0]].iloc[0]
     divisor = detect_timestamp_unit(sample_ts)
-    df['date'] = pd.to_datetime(df[COLUMNS[0]] // divisor, unit='s', utc=True)
+    # 초 단위로 내림한 정수 → ns 정수 배열 → datetime64 (파서 없이 캐스트)
+    ns = (df[COLUMNS[0]].to_numpy(np.int64) // divisor) * 1_000_000_000
+    df['date'] = pd.to_datetime(ns, utc=True)
 
     if utc_to_kst:
         df['date'] = df['date'].dt.tz_convert('Asia/Seoul')
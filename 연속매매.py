@@ -2,125 +2,327 @@
 """
 variability_signal_reversal_backtest.py
 
-* 지정 월(YYYY-MM) 전체 1분봉 데이터에 기반하여 멀티타임프레임 하락율 진입 신호로 포지션 진입
+* 지정 월(YYYY-MM) 전체 1분봉 데이터에서 --start 시각에 롱으로 첫 진입
 * 한 포지션(no-scale)만 보유, TP/LIQ/OPEN 판정
 * 롱 진입 후 종료 시점에 숏으로 반전, 숏 종료 시점에 롱으로 반전하여 반복
-* 결과 CSV 저장 및 TP/LIQ/OPEN 건수, 수익 통계 출력
+  (청산 봉에서 바로 재진입하므로 하락율 진입 신호는 쓰지 않음, --th* 는 효과 없는 deprecated 옵션)
+* 결과 저장 (기본 Parquet, --csv 지정 시 CSV) 및 TP/LIQ/OPEN 건수, 수익 통계 출력
+* 여러 월을 지정하면 월별로 독립 실행 (ProcessPoolExecutor 병렬)
+* 여러 leverage/roi_net 을 지정하면 월마다 조합별 스레드 병렬 (numba prange)
 """
 import os
+import re
 import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+import numpy as np
 import pandas as pd
 
+from utils._njit import HAS_NUMBA, njit, prange
+from utils.crossing import sparse_table, first_ge, first_le
+from utils.fileio import HAS_ARROW, read_table
+from utils.period import month_bounds
+
+# 결과 · 방향 코드 (_reversal_into 기록값)
+RES_OPEN, RES_TP, RES_LIQ = 0, 1, 2
+RESULTS = ('OPEN', 'TP', 'LIQ')
+LONG, SHORT = 1, -1              # 방향 부호 sign
+DIRECTIONS = ('long', 'short')  # Categorical 코드 (1-sign)//2
+
 # ─────────────────────────────────────────
 def load_converted(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
-    if 'date' not in df.columns or 'close' not in df.columns:
-        raise ValueError("CSV에 'date' 또는 'close' 컬럼이 없습니다.")
-    df['time'] = pd.to_datetime(df['date'])
-    df['price'] = pd.to_numeric(df['close'], errors='coerce')
-    return df[['time','price']].dropna().set_index('time')
-
-
-def compute_signals(df: pd.DataFrame, thresholds: dict) -> pd.Series:
-    signals = pd.Series(False, index=df.index)
-    for tf, th in thresholds.items():
-        past = df['price'].shift(tf)
-        drop = (past - df['price']) / past
-        signals |= (drop >= th)
-    return signals
-
-
-def run_reversal_backtest(df: pd.DataFrame, signals: pd.Series,
-                          roi_net: float, leverage: int, init_m: float, mmr: float,
-                          start_time: pd.Timestamp) -> pd.DataFrame:
-    trades = []
-    direction = 'long'
-    idx = df.index.get_indexer([start_time], method='bfill')[0]
-    total = len(df)
+    """변환 CSV 또는 Parquet 에서 date/close 만 로드 → price (index=time)"""
+    try:
+        df = read_table(path, columns=['date','close'])
+    except (ValueError, KeyError) as e:
+        raise ValueError("CSV에 'date' 또는 'close' 컬럼이 없습니다.") from e
+    # 파일의 오프셋(UTC, KST 등)을 그대로 유지 → 월 구간도 그 tz 기준. 오프셋 없는 파일만 UTC 로 간주
+    df['time'] = pd.to_datetime(df.pop('date'), format='ISO8601')
+    if df['time'].dt.tz is None:
+        df['time'] = df['time'].dt.tz_localize('UTC')
+    df['price'] = pd.to_numeric(df.pop('close'), errors='coerce')
+    return df.dropna().set_index('time').sort_index()
+
+
+@lru_cache(maxsize=8)
+def _load_cached(path: str, mtime_ns: int) -> pd.DataFrame:
+    return load_converted(path)
+
+
+def load_converted_cached(path: str) -> pd.DataFrame:
+    """같은 프로세스에서 반복 호출 시 파일이 바뀌지 않았으면 파싱 생략 (반환 DataFrame 은 수정 금지)"""
+    path = os.path.abspath(path)
+    return _load_cached(path, os.stat(path).st_mtime_ns)
+
+
+def month_slice(df: pd.DataFrame, month: str) -> pd.DataFrame:
+    """정렬된 시간 index 에서 month 구간을 이진 탐색으로 잘라냄"""
+    lo, hi = month_bounds(month, df.index.tz)
+    i, j = df.index.searchsorted([lo, hi])
+    return df.iloc[i:j]
+
+
+@njit(cache=True)
+def _first_cross(tbl_min, tbl_max, prices, start, x, sign):
+    """start 이상에서 처음 sign*(price - x) >= 0 인 인덱스 (없으면 -1)"""
+    if sign > 0:
+        return first_ge(tbl_max, prices, start, x)
+    return first_le(tbl_min, prices, start, x)
+
+
+@njit(cache=True)
+def _reversal_into(prices, start_i, roi_net, leverage, init_m, mmr, tbl_min, tbl_max, max_hold,
+                   entry_i, exit_i, exit_price, result, direction, hold_min):
+    """반전 매매 체인을 주어진 배열에 기록하고 거래 수 반환
+
+    entry_i, exit_i(-1=OPEN), exit_price, result_code, sign, hold 순.
+    max_hold > 0 이면 진입 후 max_hold 봉 안에 TP/LIQ 가 없을 때 OPEN 으로 기록하고,
+    OPEN 은 청산 봉이 없어 반전 재진입도 없으므로 체인은 그 거래에서 끝난다 (이후 봉은 거래 안 함).
+    """
+    total = len(prices)
+    n = 0
+    sign = LONG
+    idx = start_i
+    # 거래마다 같은 상수 → 루프 밖에서 한 번만
+    t = roi_net / leverage
+    margin = init_m
+    notional = margin * leverage
     while idx < total-1:
-        entry_price = df['price'].iat[idx]
-        # calculate TP and initial liq price
-        t = roi_net / leverage
-        tp_price = entry_price * (1 + t) if direction=='long' else entry_price * (1 - t)
-        margin = init_m
-        qty = margin * leverage / entry_price
+        entry_price = prices[idx]
+        # calculate TP and liq price (포지션 추가 없음 → 진입 시 고정)
+        # 롱/숏을 부호 하나로: 1+sign*t, qty*avg - sign*margin, 1 - sign*mmr (±1 곱은 정확)
+        qty = notional / entry_price
         avg = entry_price
-        res = 'OPEN'; hold=0; exit_time=None; exit_price=None
-        # iterate until close
-        for offset in range(idx+1, total):
-            price = df['price'].iat[offset]
-            ts = df.index[offset]
-            hold = offset - idx
-            # take profit
-            if direction=='long' and price >= tp_price:
-                res='TP'; exit_time=ts; exit_price=price; break
-            if direction=='short' and price <= tp_price:
-                res='TP'; exit_time=ts; exit_price=price; break
-            # liquidation price
-            if direction=='long':
-                liq_price = (avg*qty - margin)/(qty*(1-mmr))
-                if price <= liq_price:
-                    res='LIQ'; exit_time=ts; exit_price=price; break
-            else:
-                # short liq: symmetric for simplicity
-                liq_price = (margin + qty*avg)/(qty*(1+mmr))
-                if price >= liq_price:
-                    res='LIQ'; exit_time=ts; exit_price=price; break
+        tp_price = entry_price * (1 + sign*t)
+        liq_price = (qty*avg - sign*margin)/(qty*(1 - sign*mmr))
+        # 판정 구간 끝 (max_hold 제한)
+        end = total-1 if max_hold <= 0 else min(total-1, idx + max_hold)
+        # TP/LIQ 첫 도달 봉 (없으면 -1): TP 는 sign*(price-tp) >= 0, LIQ 는 sign*(liq-price) >= 0
+        j_tp = _first_cross(tbl_min, tbl_max, prices, idx+1, tp_price, sign)
+        j_liq = _first_cross(tbl_min, tbl_max, prices, idx+1, liq_price, -sign)
+        if j_tp > end:
+            j_tp = -1
+        if j_liq > end:
+            j_liq = -1
+        # 같은 봉이면 TP 우선
+        if j_tp >= 0 and (j_liq < 0 or j_tp <= j_liq):
+            res = RES_TP; exit_ = j_tp
+        elif j_liq >= 0:
+            res = RES_LIQ; exit_ = j_liq
+        else:
+            res = RES_OPEN; exit_ = -1
         # record
-        trades.append({
-            'Entry_Time': df.index[idx],
-            'Entry_Price': entry_price,
-            'Direction': direction,
-            'Result': res,
-            'Hold_Min': hold,
-            'Exit_Time': exit_time,
-            'Exit_Price': exit_price
-        })
+        entry_i[n] = idx
+        exit_i[n] = exit_
+        exit_price[n] = prices[exit_] if exit_ >= 0 else np.nan
+        result[n] = res
+        direction[n] = sign
+        hold_min[n] = (exit_ if exit_ >= 0 else end) - idx
+        n += 1
         # prepare next
-        direction = 'short' if direction=='long' else 'long'
-        # move idx to next signal or just after exit
-        if exit_time is None:
+        sign = -sign
+        if exit_ < 0:
             break
-        # find next valid signal at or after exit_time
-        next_idx = signals.index.get_indexer([exit_time], method='bfill')[0]
-        idx = next_idx
-    return pd.DataFrame(trades)
-
-
-def backtest(path: str, month: str, out_base: str, thresholds: dict,
-             roi_net: float, leverage: int, init_m: float, mmr: float,
-             start_time: str):
-    df = load_converted(path)
-    df_month = df[df.index.strftime('%Y-%m')==month]
-    signals = compute_signals(df_month, thresholds)
-    start_ts = pd.to_datetime(start_time)
-    start_ts = start_ts.tz_localize('UTC')
-    trades = run_reversal_backtest(df_month, signals, roi_net, leverage, init_m, mmr, start_ts)
-    # save
-    trades.to_csv(f"{out_base}_trades.csv", index=False)
-    # stats
-    total=len(trades)
-    tp=(trades['Result']=='TP').mean()*100
-    liq=(trades['Result']=='LIQ').mean()*100
-    openp=(trades['Result']=='OPEN').mean()*100
-    print(f"Trades: {total}, TP: {tp:.2f}%, LIQ: {liq:.2f}%, OPEN: {openp:.2f}%")
+        # 청산 봉에서 바로 반대 방향 진입
+        # (기존 signals.index.get_indexer([exit_time], method='bfill') 은 시각이 index 에 있으므로
+        #  항상 청산 봉 자신 → 조회 없이 인덱스 그대로 사용)
+        idx = exit_
+    return n
+
+
+def _alloc_trades(shape) -> tuple:
+    """_reversal_into 출력 배열 (entry_i, exit_i, exit_price, result, direction, hold_min)"""
+    # 거래 수 상한은 봉 수. 인덱스 · 보유분은 int32 로 충분
+    # 가격은 float64 유지: BTC 8만대에서 float32 간격(~0.008)이 틱(0.01)과 비슷해 TP/LIQ 판정이 바뀜
+    # (sparse table 만 float32 + 멈춘 봉 float64 재확인)
+    return (np.empty(shape, np.int32), np.empty(shape, np.int32), np.empty(shape, np.float64),
+            np.empty(shape, np.int8), np.empty(shape, np.int8), np.empty(shape, np.int32))
+
+
+@njit(cache=True, parallel=True, nogil=True)
+def _sweep(prices, start_i, params, tbl_min, tbl_max, max_hold,
+           entry_i, exit_i, exit_price, result, direction, hold_min, counts):
+    """params[c] = (roi_net, leverage, init_m, mmr) 마다 한 스레드, 가격 · 테이블은 공유 (읽기 전용)"""
+    for c in prange(params.shape[0]):
+        counts[c] = _reversal_into(prices, start_i, params[c, 0], params[c, 1], params[c, 2], params[c, 3],
+                                   tbl_min, tbl_max, max_hold,
+                                   entry_i[c], exit_i[c], exit_price[c], result[c], direction[c], hold_min[c])
+
+
+def _trades_frame(df: pd.DataFrame, prices: np.ndarray, entry_i, exit_i, exit_price,
+                  result, direction, hold) -> pd.DataFrame:
+    return pd.DataFrame({
+        'Entry_Time':  df.index.array.take(entry_i),
+        'Entry_Price': prices[entry_i],
+        'Direction':   pd.Categorical.from_codes((1 - direction) // 2, DIRECTIONS),
+        'Result':      pd.Categorical.from_codes(result, RESULTS),
+        'Hold_Min':    hold,
+        'Exit_Time':   df.index.array.take(exit_i, allow_fill=True),
+        'Exit_Price':  exit_price,
+    })
+
+
+def parse_start(value: str):
+    """--start 값 → Timestamp(절대 시각, tz 없으면 UTC) 또는 Timedelta(UTC 월초 기준 오프셋)"""
+    if re.fullmatch(r'[+-]?\d+(\.\d*)?', value):  # 단위 없는 숫자는 ns 로 읽히므로 거부
+        raise ValueError(f"--start 에 단위가 없습니다: {value!r} (예: 01:01, 61min)")
+    if re.fullmatch(r'\d+:\d{2}', value):  # HH:MM
+        value += ':00'
+    try:
+        return pd.Timedelta(value)
+    except ValueError:
+        ts = pd.Timestamp(value)
+        return ts.tz_localize('UTC') if ts.tz is None else ts
+
+
+def month_start(start, month: str, tz) -> pd.Timestamp:
+    """month 의 진입 시작 시각: 오프셋이면 UTC 월초 + 오프셋 (tz 없는 절대 시각과 같은 기준),
+    절대 시각이면 파일 tz 기준 그 달 안일 때만 사용하고 아니면 월초"""
+    if isinstance(start, pd.Timedelta):
+        return month_bounds(month, 'UTC')[0] + start
+    lo, hi = month_bounds(month, tz)
+    return start if lo <= start < hi else lo
+
+
+def _start_index(df: pd.DataFrame, start_time: pd.Timestamp) -> int:
+    """start_time 이후 첫 봉 (없으면 len → 거래 없음), int64(ns) 시각으로 이진 탐색"""
+    times = df.index.as_unit('ns').asi8
+    return np.searchsorted(times, start_time.as_unit('ns').value, side='left')
+
+
+def run_reversal_backtest(df: pd.DataFrame, roi_net: float, leverage: int, init_m: float, mmr: float,
+                          start_time: pd.Timestamp, max_hold: int = 0) -> pd.DataFrame:
+    """설정 하나의 반전 체인 → 거래 DataFrame"""
+    # pandas 조회 없이 배열로만 계산, Timestamp 는 결과 생성 시에만
+    prices = df['price'].to_numpy(np.float64)
+    out = _alloc_trades(len(prices))
+    n = _reversal_into(prices, _start_index(df, start_time), roi_net, leverage, init_m, mmr,
+                       sparse_table(prices, False), sparse_table(prices, True), max_hold, *out)
+    return _trades_frame(df, prices, *(a[:n] for a in out))
+
+
+def run_reversal_sweep(df: pd.DataFrame, params: list,
+                       start_time: pd.Timestamp, max_hold: int = 0) -> list:
+    """같은 월에서 params [(roi_net, leverage, init_m, mmr), ...] 를 스레드 병렬로 → 거래 DataFrame 목록"""
+    prices = df['price'].to_numpy(np.float64)
+    params = np.asarray(params, dtype=np.float64).reshape(-1, 4)
+    out = _alloc_trades((len(params), len(prices)))
+    counts = np.zeros(len(params), np.int64)
+    _sweep(prices, _start_index(df, start_time), params,
+           sparse_table(prices, False), sparse_table(prices, True), max_hold, *out, counts)
+    return [_trades_frame(df, prices, *(a[c, :counts[c]] for a in out)) for c in range(len(params))]
+
+
+def _run_one(cfg) -> list:
+    """한 달 (df_month, params, start_ts, max_hold) 실행 → params 순서의 거래 목록
+    (설정 하나면 스레드 풀 없이 바로, 여럿이면 스레드 병렬)"""
+    df_month, params, start_ts, max_hold = cfg
+    if len(params) == 1:
+        return [run_reversal_backtest(df_month, *params[0], start_ts, max_hold)]
+    return run_reversal_sweep(df_month, params, start_ts, max_hold)
+
+
+def save_trades(trades: pd.DataFrame, out_base: str, csv: bool = False):
+    """<out>_trades.parquet (zstd) 또는 --csv 시 <out>_trades.csv"""
+    if not csv and not HAS_ARROW:
+        print('pyarrow 미설치 → CSV 로 저장합니다.')
+        csv = True
+    if csv:
+        trades.to_csv(f"{out_base}_trades.csv", index=False)
+    else:
+        trades.to_parquet(f"{out_base}_trades.parquet", compression='zstd', index=False)
+
+
+def _labels(keys: list) -> list:
+    """중복 없는 파일명 조각 (겹치면 순번 추가)"""
+    if len(set(keys)) == len(keys):
+        return keys
+    return [f"{k}_{i}" for i, k in enumerate(keys)]
+
+
+def _report_all(done, names: list, csv: bool):
+    """완료 순서대로 저장 · 통계 출력"""
+    for i, trades_list in done:
+        for (name, tag), trades in zip(names[i], trades_list):
+            # save
+            save_trades(trades, name, csv)
+            # stats
+            total=len(trades)
+            tp=(trades['Result']=='TP').mean()*100
+            liq=(trades['Result']=='LIQ').mean()*100
+            openp=(trades['Result']=='OPEN').mean()*100
+            prefix = f"[{tag}] " if tag else ""
+            print(f"{prefix}Trades: {total}, TP: {tp:.2f}%, LIQ: {liq:.2f}%, OPEN: {openp:.2f}%")
+
+
+def backtest(path: str, months: list, out_base: str, params: list,
+             start_time, csv: bool = False, max_hold: int = 0):
+    """months: [YYYY-MM, ...] 는 프로세스 병렬,
+    params: [(roi_net, leverage, init_m, mmr), ...] 는 월마다 스레드 병렬 (가격 배열 공유)
+    start_time: UTC 월초 기준 오프셋('01:01', '1h1min') 또는 절대 시각('2025-03-01T01:01', tz 없으면 UTC)
+    """
+    df = load_converted_cached(path)
+    start = parse_start(start_time) if isinstance(start_time, str) else start_time
+    # 파일은 한 번만 읽고 월 단위로 잘라 워커에 넘김 (같은 달은 한 번만)
+    months = list(dict.fromkeys(months))
+    jobs = [(month_slice(df, month), params, month_start(start, month, df.index.tz), max_hold)
+            for month in months]
+    # 출력 이름: 여러 월이면 _<month>, 여러 파라미터면 _lev<L>_roi<R>
+    month_keys = months if len(months) > 1 else ['']
+    param_keys = _labels([f"lev{lev:g}_roi{roi:g}" for roi, lev, _, _ in params]) if len(params) > 1 else ['']
+    names = [[('_'.join(filter(None, (out_base, mk, pk))), ' '.join(filter(None, (mk, pk))))
+              for pk in param_keys] for mk in month_keys]
+
+    ncpu = os.cpu_count() or 1
+    if len(jobs) == 1 or ncpu == 1:
+        _report_all(((j, _run_one(job)) for j, job in enumerate(jobs)), names, csv)
+    else:
+        # import 시 _warmup 이 numba 병렬 스레드를 띄우므로 fork 대신 spawn
+        # (fork 된 자식에서 병렬 커널 호출 시 멈춤, 자식은 cache 에서 커널을 로드)
+        with ProcessPoolExecutor(max_workers=min(ncpu, len(jobs)), mp_context=get_context('spawn')) as ex:
+            futs = {ex.submit(_run_one, job): j for j, job in enumerate(jobs)}
+            _report_all(((futs[f], f.result()) for f in as_completed(futs)), names, csv)
+
+
+def _warmup():
+    """실제 호출과 같은 인자 타입으로 커널을 한 번 돌려 JIT 컴파일(또는 cache 로드)을 import 시점에 끝냄"""
+    prices = np.linspace(100.0, 101.0, 16)
+    tbl_min, tbl_max = sparse_table(prices, False), sparse_table(prices, True)
+    start_i = np.searchsorted(prices, prices[0])
+    _reversal_into(prices, start_i, 0.05, 20, 2000.0, 0.005, tbl_min, tbl_max, 0, *_alloc_trades(16))
+    _sweep(prices, start_i, np.array([[0.05, 20.0, 2000.0, 0.005]]), tbl_min, tbl_max, 0,
+           *_alloc_trades((1, 16)), np.zeros(1, np.int64))
+
+
+if HAS_NUMBA:
+    _warmup()
 
 
 if __name__=='__main__':
     parser=argparse.ArgumentParser()
     parser.add_argument('converted_csv')
-    parser.add_argument('--month', default='2025-03')
+    parser.add_argument('--month', nargs='+', default=['2025-03'],
+                        help='YYYY-MM, 파일 date 의 tz 기준 (여러 개면 월별 병렬 실행)')
     parser.add_argument('--out',   default='reversal_backtest')
-    parser.add_argument('--start', default='2025-03-01 01:01')
-    parser.add_argument('--th5',   type=float, default=0.01)
-    parser.add_argument('--th10',  type=float, default=0.015)
-    parser.add_argument('--th30',  type=float, default=0.02)
-    parser.add_argument('--th60',  type=float, default=0.025)
-    parser.add_argument('--th360', type=float, default=0.03)
-    parser.add_argument('--leverage',type=int, default=20)
-    parser.add_argument('--roi_net', type=float, default=0.05)
+    parser.add_argument('--start', default='01:01', type=parse_start,
+                        help='월마다 진입 시작: UTC 월초 기준 오프셋(HH:MM, 1h1min) 또는 '
+                             'YYYY-MM-DDTHH:MM (tz 없으면 UTC, 그 달에만 적용, 다른 달은 월초부터)')
+    # deprecated: 반전 체인은 진입 신호를 보지 않음 → 기존 명령어 호환용으로만 받고 무시
+    for tf in (5, 10, 30, 60, 360):
+        parser.add_argument(f'--th{tf}', type=float, help='deprecated, 효과 없음')
+    parser.add_argument('--leverage',type=int, nargs='+', default=[20],
+                        help='여러 개면 roi_net 과의 조합을 스레드 병렬 실행')
+    parser.add_argument('--roi_net', type=float, nargs='+', default=[0.05])
     parser.add_argument('--init_m',  type=float, default=2000)
     parser.add_argument('--mmr',     type=float, default=0.005)
+    parser.add_argument('--max-hold', type=int, default=0,
+                        help='진입 후 이 분 수 안에 TP/LIQ 없으면 OPEN 처리하고 체인 종료 '
+                             '(그 달의 남은 봉은 거래 안 함, 0=월말까지)')
+    parser.add_argument('--csv',     action='store_true', help='Parquet 대신 CSV 로 저장')
     args=parser.parse_args()
-    thr={5:args.th5,10:args.th10,30:args.th30,60:args.th60,360:args.th360}
-    backtest(args.converted_csv,args.month,args.out,thr,args.roi_net,args.leverage,args.init_m,args.mmr,args.start)
+    ths=[f'--th{tf}' for tf in (5, 10, 30, 60, 360) if getattr(args, f'th{tf}') is not None]
+    if ths:
+        print(f"경고: {', '.join(ths)} 는 deprecated 이며 거래 결과에 영향이 없습니다 (무시)")
+    params=[(roi,lev,args.init_m,args.mmr) for lev in args.leverage for roi in args.roi_net]
+    backtest(args.converted_csv,args.month,args.out,params,args.start,args.csv,args.max_hold)